@@ -6,6 +6,7 @@ load_dotenv()
 class Config:
     # API Configuration
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+    GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")  # None uses the Groq default endpoint
     
     # Model Configuration
     DEFAULT_MODEL = "llama-3.3-70b-versatile"
@@ -14,17 +15,35 @@ class Config:
     # Document Processing
     MAX_CHUNK_SIZE = 1500
     CHUNK_OVERLAP = 300
+    DEDUP_SHINGLE_SIZE = 3  # words per shingle for near-duplicate fingerprints
+    DEDUP_MAX_HAMMING = 6  # SimHash bit difference for near-duplicate candidates (max 7)
+    DEDUP_MIN_SIMILARITY = 0.95  # word-level match ratio a candidate needs to be folded
     MAX_CONTEXTS = 8
+    FUSION_RANK_CONSTANT = 60  # reciprocal rank fusion damping for paraphrase search
     
     # Vector Database
     EMBEDDING_MODEL = "all-MiniLM-L6-v2"
     VECTOR_DIMENSIONS = 384
+    IVF_THRESHOLD = 1000  # chunk count above which an IVF index is used
+    
+    # Hierarchical Retrieval
+    HIERARCHICAL_MIN_CHUNKS = 2000  # smaller documents use the flat search only
+    HIERARCHICAL_MIN_SECTIONS = 20
+    HIERARCHICAL_TOP_SECTIONS = 8  # sections searched per query
+    HIERARCHICAL_MAX_CANDIDATES = 512  # chunks scored per query across those sections
     
     # Performance
     BATCH_SIZE = 50
     MAX_TOKENS = 1200
     TEMPERATURE = 0.1
     
+    # Conversation Memory
+    HISTORY_TOKEN_BUDGET = 1500  # tokens of past turns sent per request
+    SUMMARY_TOKEN_BUDGET = 400  # tokens kept for digests of dropped turns
+    TURN_SUMMARY_TOKENS = 60
+    MAX_HISTORY_TURNS = 20  # turns stored verbatim per session
+    HISTORY_ENCODING = "cl100k_base"
+    
     # UI Configuration - DocuGPT
     PAGE_TITLE = "DocuGPT - AI-Powered Document Assistant"
     PAGE_ICON = "🤖"
@@ -32,3 +51,24 @@ class Config:
     # File Upload
     MAX_FILE_SIZE = 50  # MB
     ALLOWED_EXTENSIONS = ["pdf"]
+    
+    # Background Ingestion
+    INGESTION_WORKERS = 2
+    INGESTION_QUEUE_SIZE = 8  # queued plus running jobs across all sessions
+    INGESTION_JOB_RETENTION = 600  # seconds a finished job stays pollable
+    INGESTION_POLL_INTERVAL = 1  # seconds between UI status refreshes
+    
+    # Shared Document Registry
+    REGISTRY_MAX_MB = 1024  # unreferenced documents are evicted above this
+    REGISTRY_IDLE_TTL = 300  # seconds an unreferenced document is kept for reuse
+    
+    # Memory Governor
+    MEMORY_CEILING_MB = int(os.getenv("DOCUGPT_MEMORY_CEILING_MB", "2048"))
+    SESSION_IDLE_SECONDS = 900  # idle sessions are spilled to disk after this
+    SESSION_MIN_IDLE_SECONDS = 30  # sessions active more recently are never spilled
+    SPILL_DIR = os.getenv("DOCUGPT_SPILL_DIR")  # parent of the private per-process spill dirs; None uses the system temp dir
+    SPILL_RETENTION = 86400  # seconds spilled files are kept on disk
+    SPILL_CLEANUP_INTERVAL = 3600
+    
+    # Incremental Re-indexing
+    INCREMENTAL_MAX_CHANGED_RATIO = 0.5  # above this share of changed pages, re-ingest fully
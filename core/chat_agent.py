@@ -3,19 +3,21 @@ from groq import Groq
 from typing import List, Dict, Optional, Generator
 from config import Config
 from datetime import datetime
+from core.conversation_memory import ConversationMemory
+from utils.chunk_deduplicator import describe_differences
 
 class AdvancedChatAgent:
     def __init__(self, rag_engine):
         self.config = Config()
-        self.client = Groq(api_key=self.config.GROQ_API_KEY)
+        self.client = Groq(api_key=self.config.GROQ_API_KEY, base_url=self.config.GROQ_BASE_URL)
         self.rag_engine = rag_engine
-        self.conversation_history = []
+        self.conversation_memory = ConversationMemory()
         self.current_document = None
         
     def set_document(self, document_data: Dict):
         """Set current document context"""
         self.current_document = document_data
-        self.conversation_history = []  # Reset conversation for new document
+        self.conversation_memory.clear()  # Reset conversation for new document
     
     def analyze_query_intent(self, query: str) -> str:
         """Analyze user query to determine intent"""
@@ -89,19 +91,7 @@ Current query intent: {intent}"""
         context = self.prepare_context(relevant_chunks, intent)
         
         # Prepare messages
-        messages = [
-            {"role": "system", "content": self.get_contextual_system_prompt(intent)}
-        ]
-        
-        # Add conversation history (last 6 messages)
-        messages.extend(self.conversation_history[-6:])
-        
-        # Add context
-        if context:
-            messages.append({"role": "system", "content": context})
-        
-        # Add current query
-        messages.append({"role": "user", "content": user_query})
+        messages = self.build_messages(user_query, intent, context)
         
         try:
             response = self.client.chat.completions.create(
@@ -114,14 +104,31 @@ Current query intent: {intent}"""
             ai_response = response.choices[0].message.content
             
             # Update conversation history
-            self.conversation_history.append({"role": "user", "content": user_query})
-            self.conversation_history.append({"role": "assistant", "content": ai_response})
+            self.conversation_memory.add_turn(user_query, ai_response)
             
             return ai_response
             
         except Exception as e:
             return f"I apologize, but I'm experiencing technical difficulties. Please try again. Error: {str(e)}"
     
+    def build_messages(self, user_query: str, intent: str, context: str) -> List[Dict]:
+        """Assemble prompt messages with token-budgeted conversation history"""
+        messages = [
+            {"role": "system", "content": self.get_contextual_system_prompt(intent)}
+        ]
+        
+        # Add conversation history (bounded by HISTORY_TOKEN_BUDGET)
+        messages.extend(self.conversation_memory.get_messages())
+        
+        # Add context
+        if context:
+            messages.append({"role": "system", "content": context})
+        
+        # Add current query
+        messages.append({"role": "user", "content": user_query})
+        
+        return messages
+    
     def prepare_context(self, relevant_chunks: List[Dict], intent: str) -> str:
         """Prepare context from relevant chunks"""
         if not relevant_chunks:
@@ -131,11 +138,34 @@ Current query intent: {intent}"""
         
         for i, result in enumerate(relevant_chunks, 1):
             chunk = result["chunk"]
-            context += f"Section {i} (from {chunk['section']}):\n"
-            context += f"{chunk['text']}\n\n"
+            context += f"Section {i} (from {self.format_location(chunk)}):\n"
+            
+            # Collapsed duplicates also point at the other places the text appears
+            other_occurrences = chunk.get("occurrences", [])[1:]
+            other_locations = [
+                self.format_location(occurrence) for occurrence in other_occurrences if "text" not in occurrence
+            ][:3]
+            if other_locations:
+                context += f"(Also appears in: {', '.join(other_locations)})\n"
+            
+            context += f"{chunk['text']}\n"
+            
+            # Near-duplicate variants differ in a few words (e.g. values per model); spell those out
+            for occurrence in other_occurrences:
+                if "text" in occurrence:
+                    differences = describe_differences(chunk["text"], occurrence["text"])
+                    context += f"(In {self.format_location(occurrence)}: {differences})\n"
+            
+            context += "\n"
         
         return context
     
+    def format_location(self, location: Dict) -> str:
+        """Section title of a chunk or occurrence, with its page when known"""
+        if location.get("page_number") is not None:
+            return f"{location['section']} (page {location['page_number']})"
+        return location["section"]
+    
     def generate_streaming_response(self, user_query: str) -> Generator[str, None, None]:
         """Generate streaming response for better UX"""
         if not self.current_document:
@@ -146,16 +176,7 @@ Current query intent: {intent}"""
         relevant_chunks = self.rag_engine.search_similar_chunks(user_query, top_k=8)
         context = self.prepare_context(relevant_chunks, intent)
         
-        messages = [
-            {"role": "system", "content": self.get_contextual_system_prompt(intent)}
-        ]
-        
-        messages.extend(self.conversation_history[-6:])
-        
-        if context:
-            messages.append({"role": "system", "content": context})
-        
-        messages.append({"role": "user", "content": user_query})
+        messages = self.build_messages(user_query, intent, context)
         
         try:
             response = self.client.chat.completions.create(
@@ -174,8 +195,7 @@ Current query intent: {intent}"""
                     yield content
             
             # Update conversation history
-            self.conversation_history.append({"role": "user", "content": user_query})
-            self.conversation_history.append({"role": "assistant", "content": full_response})
+            self.conversation_memory.add_turn(user_query, full_response)
             
         except Exception as e:
             yield f"Error: {str(e)}"
@@ -0,0 +1,123 @@
+import tiktoken
+from typing import List, Dict, Optional
+from config import Config
+
+class ConversationMemory:
+    """Token-budgeted conversation history with compaction of older turns"""
+
+    def __init__(self, token_budget: Optional[int] = None, max_turns: Optional[int] = None):
+        self.config = Config()
+        self.token_budget = token_budget or self.config.HISTORY_TOKEN_BUDGET
+        self.max_turns = max_turns or self.config.MAX_HISTORY_TURNS
+        self.encoding = self.load_encoding()
+        self.turns = []
+        self.summary_lines = []
+
+    def load_encoding(self):
+        """Load the tokenizer, falling back to a character estimate when unavailable"""
+        try:
+            return tiktoken.get_encoding(self.config.HISTORY_ENCODING)
+        except Exception:
+            # tiktoken fetches encodings on first use; offline hosts fall back to estimates
+            return None
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens in text"""
+        if not text:
+            return 0
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate_tokens(self, text: str, max_tokens: int) -> str:
+        """Truncate text to at most max_tokens tokens"""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        if self.encoding is None:
+            return text[:max_tokens * 4].rstrip() + "..."
+        tokens = self.encoding.encode(text, disallowed_special=())
+        return self.encoding.decode(tokens[:max_tokens]).rstrip() + "..."
+
+    def summarize_turn(self, user_message: str, assistant_message: str) -> str:
+        """Build a compact one-line digest of a question/answer turn"""
+        per_side = self.config.TURN_SUMMARY_TOKENS // 2
+        question = self.truncate_tokens(" ".join(user_message.split()), per_side)
+        answer = self.truncate_tokens(" ".join(assistant_message.split()), per_side)
+        return f"User asked: {question} | Assistant answered: {answer}"
+
+    def add_turn(self, user_message: str, assistant_message: str) -> None:
+        """Store a completed turn, compacting the oldest turns beyond the cap"""
+        summary = self.summarize_turn(user_message, assistant_message)
+        self.turns.append({
+            "user": user_message,
+            "assistant": assistant_message,
+            "tokens": self.count_tokens(user_message) + self.count_tokens(assistant_message),
+            "summary": summary,
+            "summary_tokens": self.count_tokens(summary)
+        })
+
+        while len(self.turns) > self.max_turns:
+            dropped = self.turns.pop(0)
+            self.summary_lines.append((dropped["summary"], dropped["summary_tokens"]))
+
+        # Keep the compacted digest of dropped turns within its own budget
+        summary_tokens = sum(tokens for _, tokens in self.summary_lines)
+        while self.summary_lines and summary_tokens > self.config.SUMMARY_TOKEN_BUDGET:
+            _, tokens = self.summary_lines.pop(0)
+            summary_tokens -= tokens
+
+    def get_messages(self) -> List[Dict]:
+        """Return history messages that fit within the token budget"""
+        remaining = self.token_budget
+        full_turns = []
+        digest = []
+
+        # Newest turns are kept verbatim until the budget runs out
+        index = len(self.turns) - 1
+        while index >= 0 and self.turns[index]["tokens"] <= remaining:
+            full_turns.insert(0, self.turns[index])
+            remaining -= self.turns[index]["tokens"]
+            index -= 1
+
+        # Older turns are represented by their digests, newest first
+        older = [(turn["summary"], turn["summary_tokens"]) for turn in self.turns[:index + 1]]
+        for line, tokens in reversed(self.summary_lines + older):
+            if tokens > remaining:
+                break
+            digest.insert(0, line)
+            remaining -= tokens
+
+        messages = []
+        if digest:
+            messages.append({
+                "role": "system",
+                "content": "Summary of earlier conversation:\n" + "\n".join(f"- {line}" for line in digest)
+            })
+
+        for turn in full_turns:
+            messages.append({"role": "user", "content": turn["user"]})
+            messages.append({"role": "assistant", "content": turn["assistant"]})
+
+        return messages
+
+    def to_state(self) -> Dict:
+        """Serializable snapshot of stored turns"""
+        return {"turns": self.turns, "summary_lines": self.summary_lines}
+
+    def load_state(self, state: Dict) -> None:
+        """Restore turns from a to_state snapshot"""
+        self.turns = state["turns"]
+        self.summary_lines = state["summary_lines"]
+
+    def estimate_memory_bytes(self) -> int:
+        """Rough in-memory size of stored turns"""
+        size = sum(len(turn["user"]) + len(turn["assistant"]) + len(turn["summary"]) for turn in self.turns)
+        return size + sum(len(line) for line, _ in self.summary_lines)
+
+    def clear(self) -> None:
+        """Forget all stored turns"""
+        self.turns = []
+        self.summary_lines = []
+
+    def __len__(self) -> int:
+        return len(self.turns)
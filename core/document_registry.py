@@ -0,0 +1,202 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+import weakref
+from typing import Dict, Iterable, Optional
+import streamlit as st
+from config import Config
+from core.rag_engine import OptimizedRAGEngine
+from utils.spill_store import create_spill_dir, read_spill, write_spill
+
+def compute_content_hash(file_bytes: bytes) -> str:
+    """Hash uploaded bytes to identify identical documents"""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+def estimate_document_bytes(document_data: Dict) -> int:
+    """Rough in-memory size of extracted document text"""
+    if not document_data:
+        return 0
+
+    size = len(document_data.get("full_text", ""))
+    size += sum(len(page["text"]) for page in document_data.get("pages", []))
+    size += sum(len(section["content"]) + len(section["title"]) for section in document_data.get("sections", []))
+    return size
+
+def new_document_id() -> str:
+    """Unguessable id that links the revisions of one document, so unrelated uploads are never diffed"""
+    return uuid.uuid4().hex
+
+class DocumentHandle:
+    """A session's reference to a shared, read-only registry entry"""
+
+    def __init__(self, registry: "DocumentRegistry", content_hash: str, document_data: Dict, rag_engine):
+        self.content_hash = content_hash
+        self.document_data = document_data
+        self.rag_engine = rag_engine
+        # Released explicitly, or automatically when the owning session is garbage collected
+        self._finalizer = weakref.finalize(self, registry.release, content_hash)
+
+    def release(self) -> None:
+        """Drop this session's reference; safe to call more than once"""
+        self._finalizer()
+
+class DocumentRegistry:
+    """Process-wide, reference-counted store of processed documents keyed by content hash"""
+
+    def __init__(self, max_bytes: Optional[int] = None, idle_ttl: Optional[int] = None, spill_dir: Optional[str] = None):
+        self.config = Config()
+        self.max_bytes = max_bytes or self.config.REGISTRY_MAX_MB * 1024 * 1024
+        self.idle_ttl = idle_ttl if idle_ttl is not None else self.config.REGISTRY_IDLE_TTL
+        self.spill_dir = create_spill_dir(self, "documents", spill_dir or self.config.SPILL_DIR)
+        # Reentrant: handle finalizers may fire from garbage collection while the lock is held
+        self.lock = threading.RLock()
+        self.entries: Dict[str, Dict] = {}
+        # Document id -> content hash of its latest revision; outlives sessions so a later visit can diff
+        self.revisions: Dict[str, str] = {}
+
+    def register(
+        self,
+        content_hash: str,
+        document_data: Dict,
+        rag_engine,
+        document_ids: Iterable[str] = ()
+    ) -> None:
+        """Add a processed document; it stays available for idle_ttl until a session acquires it"""
+        with self.lock:
+            if content_hash not in self.entries:
+                self.add_entry(content_hash, document_data, rag_engine)
+            for document_id in document_ids:
+                self.revisions[document_id] = content_hash
+            self.evict()
+
+    def record_revision(self, document_id: str, content_hash: str) -> None:
+        """Remember content_hash as the latest revision of a document"""
+        with self.lock:
+            self.revisions[document_id] = content_hash
+
+    def acquire_revision(self, document_id: str) -> Optional[DocumentHandle]:
+        """Attach to the latest registered revision of a document, if any"""
+        with self.lock:
+            content_hash = self.revisions.get(document_id)
+            if content_hash is None:
+                return None
+
+            handle = self.acquire(content_hash)
+            if handle is None:
+                del self.revisions[document_id]
+            return handle
+
+    def prune_revisions(self) -> None:
+        """Drop document ids whose latest revision is neither in memory nor on disk; caller must hold the lock"""
+        for document_id, content_hash in list(self.revisions.items()):
+            if content_hash not in self.entries and not os.path.exists(self.entry_path(content_hash)):
+                del self.revisions[document_id]
+
+    def add_entry(self, content_hash: str, document_data: Dict, rag_engine) -> Dict:
+        """Insert an unreferenced in-memory entry; caller must hold the lock"""
+        entry = {
+            "document_data": document_data,
+            "rag_engine": rag_engine,
+            "refs": 0,
+            "size": estimate_document_bytes(document_data) + rag_engine.estimate_memory_bytes(),
+            "last_used": time.time()
+        }
+        self.entries[content_hash] = entry
+        return entry
+
+    def acquire(self, content_hash: str) -> Optional[DocumentHandle]:
+        """Attach to an entry, reloading it from disk if it was spilled"""
+        with self.lock:
+            entry = self.entries.get(content_hash)
+            if entry is None:
+                entry = self.load_entry(content_hash)
+            if entry is None:
+                return None
+
+            entry["refs"] += 1
+            entry["last_used"] = time.time()
+            return DocumentHandle(self, content_hash, entry["document_data"], entry["rag_engine"])
+
+    def release(self, content_hash: str) -> None:
+        """Drop one reference to an entry"""
+        with self.lock:
+            entry = self.entries.get(content_hash)
+            if entry is None:
+                return
+
+            entry["refs"] = max(0, entry["refs"] - 1)
+            entry["last_used"] = time.time()
+            self.evict()
+
+    def evict(self, max_bytes: Optional[int] = None) -> None:
+        """Spill unreferenced entries that are idle or needed to get back under max_bytes"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self.lock:
+            now = time.time()
+            unreferenced = sorted(
+                (entry["last_used"], content_hash)
+                for content_hash, entry in self.entries.items()
+                if entry["refs"] == 0
+            )
+
+            total = self.total_bytes()
+            for last_used, content_hash in unreferenced:
+                if now - last_used < self.idle_ttl and total <= max_bytes:
+                    break
+                self.spill_entry(content_hash, self.entries[content_hash])
+                total -= self.entries[content_hash]["size"]
+                del self.entries[content_hash]
+
+    def entry_path(self, content_hash: str) -> str:
+        """Location of an entry's spill file"""
+        return os.path.join(self.spill_dir, f"{content_hash}.npz")
+
+    def spill_entry(self, content_hash: str, entry: Dict) -> None:
+        """Write an entry to disk so it can be reloaded after eviction"""
+        path = self.entry_path(content_hash)
+        if os.path.exists(path):
+            # Content-addressed: an earlier spill of the same bytes is still valid
+            return
+
+        rag_metadata, arrays = entry["rag_engine"].to_state()
+        write_spill(path, {"document_data": entry["document_data"], "rag_state": rag_metadata}, arrays)
+
+    def load_entry(self, content_hash: str) -> Optional[Dict]:
+        """Reload a spilled entry into memory; caller must hold the lock"""
+        path = self.entry_path(content_hash)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            metadata, arrays = read_spill(path)
+            rag_engine = OptimizedRAGEngine.from_state(metadata["rag_state"], arrays)
+        except Exception:
+            # Unreadable spill: drop it so the document is processed again on next upload
+            os.remove(path)
+            self.prune_revisions()
+            return None
+        os.utime(path)
+
+        return self.add_entry(content_hash, metadata["document_data"], rag_engine)
+
+    def remove_stale_spills(self, max_age: int) -> None:
+        """Delete spilled entries that have not been reloaded for max_age seconds"""
+        cutoff = time.time() - max_age
+        with self.lock:
+            for name in os.listdir(self.spill_dir):
+                path = os.path.join(self.spill_dir, name)
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            self.prune_revisions()
+
+    def total_bytes(self) -> int:
+        """Estimated memory held by all entries"""
+        with self.lock:
+            return sum(entry["size"] for entry in self.entries.values())
+
+@st.cache_resource
+def get_document_registry() -> DocumentRegistry:
+    """Shared document registry for every session in this process"""
+    return DocumentRegistry()
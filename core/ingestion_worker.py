@@ -0,0 +1,264 @@
+import io
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import streamlit as st
+from config import Config
+from core.document_registry import DocumentHandle, DocumentRegistry, compute_content_hash, get_document_registry
+from core.rag_engine import OptimizedRAGEngine, load_embedding_model
+from utils.chunk_deduplicator import ChunkDeduplicator
+from utils.pdf_processor import AdvancedPDFProcessor
+from utils.progress import IngestionCancelled, scaled_progress_callback
+
+class IngestionQueueFull(Exception):
+    """Raised when the ingestion queue cannot accept another job"""
+
+class IngestionJob:
+    """Status and result record for one document ingestion"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, content_hash: str, file_name: str):
+        self.job_id = uuid.uuid4().hex
+        self.content_hash = content_hash
+        self.file_name = file_name
+        self.status = self.QUEUED
+        self.progress = 0.0
+        self.message = "Waiting for a free worker..."
+        self.error = None
+        self.dedup_stats = None
+        self.subscribers = 1
+        self.document_ids: List[str] = []  # document each subscriber is uploading a revision of
+        self.embedded_chunks = 0
+        self.reused_chunks = 0
+        self.cancel_event = threading.Event()
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (self.COMPLETED, self.FAILED, self.CANCELLED)
+
+    def update_progress(self, progress: float, message: str) -> None:
+        """Progress callback used by the pipeline; aborts when the job is cancelled"""
+        if self.cancel_event.is_set():
+            raise IngestionCancelled()
+        self.progress = progress
+        self.message = message
+
+class IngestionWorker:
+    """Process-wide worker pool that ingests uploaded documents into the shared registry"""
+
+    def __init__(self, registry: DocumentRegistry, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.config = Config()
+        self.registry = registry
+        self.max_pending = max_pending or self.config.INGESTION_QUEUE_SIZE
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or self.config.INGESTION_WORKERS,
+            thread_name_prefix="docugpt-ingest"
+        )
+        self.embedding_model = load_embedding_model()
+        self.deduplicator = ChunkDeduplicator()
+        self.lock = threading.Lock()
+        self.jobs: Dict[str, IngestionJob] = {}
+        self.in_flight: Dict[str, str] = {}  # content hash -> job id
+
+    def submit(
+        self,
+        file_bytes: bytes,
+        file_name: str,
+        content_hash: Optional[str] = None,
+        document_id: Optional[str] = None
+    ) -> str:
+        """Queue a document for ingestion, joining an identical in-flight upload if any
+
+        With a document_id, the upload is diffed against that document's latest revision
+        and then recorded as its new latest revision.
+        """
+        content_hash = content_hash or compute_content_hash(file_bytes)
+
+        with self.lock:
+            self.prune_finished_jobs()
+
+            # Identical bytes already being processed: share that job
+            job_id = self.in_flight.get(content_hash)
+            if job_id is not None:
+                self.jobs[job_id].subscribers += 1
+                if document_id is not None:
+                    self.jobs[job_id].document_ids.append(document_id)
+                return job_id
+
+            pending = sum(1 for job in self.jobs.values() if not job.done)
+            if pending >= self.max_pending:
+                raise IngestionQueueFull(
+                    f"The server is busy processing {pending} documents. Please try again shortly."
+                )
+
+            job = IngestionJob(content_hash, file_name)
+            if document_id is not None:
+                job.document_ids.append(document_id)
+            self.jobs[job.job_id] = job
+            self.in_flight[content_hash] = job.job_id
+
+        self.executor.submit(self.run_job, job, file_bytes)
+        return job.job_id
+
+    def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        """Look up a job record for status polling"""
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> None:
+        """Withdraw one subscriber; the job stops once nobody is waiting for it"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.done:
+                return
+
+            job.subscribers -= 1
+            if job.subscribers <= 0:
+                job.cancel_event.set()
+                # A running job only notices at its next progress update; new uploads must not join it
+                if self.in_flight.get(job.content_hash) == job.job_id:
+                    del self.in_flight[job.content_hash]
+                if job.status == IngestionJob.QUEUED:
+                    self.finish_job(job, IngestionJob.CANCELLED, "Cancelled")
+
+    def run_job(self, job: IngestionJob, file_bytes: bytes) -> None:
+        """Extract, chunk and embed a document on a worker thread"""
+        with self.lock:
+            if job.done:
+                return
+            job.status = IngestionJob.RUNNING
+
+        try:
+            pdf_processor = AdvancedPDFProcessor()
+
+            document_data = pdf_processor.extract_text_with_structure(
+                io.BytesIO(file_bytes),
+                progress_callback=scaled_progress_callback(job.update_progress, 0.0, 0.3)
+            )
+            if not document_data:
+                raise ValueError("No text could be extracted from the PDF")
+
+            # Diff against the latest revision of the document the submitter is updating
+            previous = self.registry.acquire_revision(job.document_ids[0]) if job.document_ids else None
+            try:
+                if previous is not None:
+                    rag_engine, message = self.reindex_revision(job, pdf_processor, document_data, previous)
+                else:
+                    rag_engine, message = self.index_document(job, pdf_processor, document_data)
+            finally:
+                if previous is not None:
+                    previous.release()
+
+            with self.lock:
+                document_ids = list(job.document_ids)
+            self.registry.register(job.content_hash, document_data, rag_engine, document_ids=document_ids)
+
+            with self.lock:
+                # Sessions that joined during registration still get their revision recorded
+                for document_id in job.document_ids[len(document_ids):]:
+                    self.registry.record_revision(document_id, job.content_hash)
+                self.finish_job(job, IngestionJob.COMPLETED, message)
+
+        except IngestionCancelled:
+            with self.lock:
+                self.finish_job(job, IngestionJob.CANCELLED, "Cancelled")
+        except Exception as e:
+            with self.lock:
+                job.error = str(e)
+                self.finish_job(job, IngestionJob.FAILED, f"Error processing document: {str(e)}")
+
+    def index_document(self, job: IngestionJob, pdf_processor: AdvancedPDFProcessor, document_data: Dict) -> Tuple[OptimizedRAGEngine, str]:
+        """Chunk and embed a whole document"""
+        job.update_progress(0.3, "Chunking document...")
+        chunks = pdf_processor.create_intelligent_chunks(document_data)
+        chunks, dedup_stats = self.deduplicator.collapse(chunks)
+        job.dedup_stats = dedup_stats
+        job.embedded_chunks = len(chunks)
+        job.reused_chunks = 0
+
+        rag_engine = OptimizedRAGEngine(embedding_model=self.embedding_model)
+        rag_engine.create_embeddings(
+            chunks,
+            progress_callback=scaled_progress_callback(job.update_progress, 0.35, 1.0)
+        )
+        return rag_engine, (
+            f"Document processed successfully! {dedup_stats['embeddings_saved']} duplicate "
+            f"chunks collapsed, {dedup_stats['unique_chunks']} embedded."
+        )
+
+    def reindex_revision(
+        self,
+        job: IngestionJob,
+        pdf_processor: AdvancedPDFProcessor,
+        document_data: Dict,
+        previous: DocumentHandle
+    ) -> Tuple[OptimizedRAGEngine, str]:
+        """Re-embed only sections or pages that changed since the document's previous revision"""
+        job.update_progress(0.3, "Comparing with previous revision...")
+        changed_pages = pdf_processor.find_changed_pages(document_data, previous.document_data)
+        total_pages = max(1, len(document_data["pages"]))
+
+        if len(changed_pages) / total_pages > self.config.INCREMENTAL_MAX_CHANGED_RATIO:
+            return self.index_document(job, pdf_processor, document_data)
+
+        new_chunks, retained_positions, retained_hashes = pdf_processor.create_incremental_chunks(
+            document_data,
+            previous.rag_engine.chunks
+        )
+
+        # The previous revision may still be open in other sessions, so update a copy
+        rag_engine = previous.rag_engine.clone()
+        new_chunks, dedup_stats = self.deduplicator.collapse(
+            new_chunks,
+            existing=[rag_engine.chunks[position] for position in retained_positions],
+            retained_section_hashes=retained_hashes,
+            page_locations=pdf_processor.page_locations(document_data)
+        )
+        job.dedup_stats = dedup_stats
+        job.embedded_chunks = len(new_chunks)
+        job.reused_chunks = len(retained_positions)
+
+        rag_engine.apply_incremental_update(
+            retained_positions,
+            new_chunks,
+            progress_callback=scaled_progress_callback(job.update_progress, 0.35, 1.0)
+        )
+        return rag_engine, (
+            f"Revision processed: {len(changed_pages)} changed pages, "
+            f"{len(new_chunks)} chunks re-embedded, {len(retained_positions)} reused, "
+            f"{dedup_stats['embeddings_saved']} duplicates collapsed."
+        )
+
+    def finish_job(self, job: IngestionJob, status: str, message: str) -> None:
+        """Mark a job finished; caller must hold the lock"""
+        job.status = status
+        job.message = message
+        job.finished_at = time.time()
+        if status == IngestionJob.COMPLETED:
+            job.progress = 1.0
+        if self.in_flight.get(job.content_hash) == job.job_id:
+            del self.in_flight[job.content_hash]
+
+    def prune_finished_jobs(self) -> None:
+        """Drop finished job records past their retention window; caller must hold the lock"""
+        cutoff = time.time() - self.config.INGESTION_JOB_RETENTION
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.done and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+@st.cache_resource
+def get_ingestion_worker() -> IngestionWorker:
+    """Shared ingestion worker for every session in this process"""
+    return IngestionWorker(get_document_registry())
@@ -0,0 +1,222 @@
+import gc
+import os
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import streamlit as st
+from config import Config
+from core.document_registry import DocumentHandle, DocumentRegistry, get_document_registry
+from utils.spill_store import create_spill_dir, read_spill, write_spill
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def remove_file(path: str) -> None:
+    """Delete a file if it exists"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class SessionWorkspace:
+    """Large per-session state that the memory governor can spill and reload"""
+
+    def __init__(self, chat_agent, registry: DocumentRegistry, spill_dir: str):
+        self.session_id = uuid.uuid4().hex
+        self.chat_agent = chat_agent
+        self.registry = registry
+        self.document_handle: Optional[DocumentHandle] = None
+        self.content_hash: Optional[str] = None
+        self.messages: List[Dict] = []
+        self.spilled = False
+        self.last_access = time.time()
+        self.lock = threading.RLock()
+        self.spill_path = os.path.join(spill_dir, f"{self.session_id}.npz")
+        # Spill files die with the session
+        weakref.finalize(self, remove_file, self.spill_path)
+
+    @property
+    def document(self) -> Optional[Dict]:
+        return self.chat_agent.current_document
+
+    @contextmanager
+    def active(self):
+        """Hold the workspace for a script run; busy workspaces are never spilled"""
+        with self.lock:
+            self.reload()
+            self.last_access = time.time()
+            yield self
+            self.last_access = time.time()
+
+    def attach(self, handle: DocumentHandle) -> None:
+        """Point this session at a shared, already processed document"""
+        with self.lock:
+            if self.spilled:
+                # Restore the spilled messages without reattaching the document being replaced
+                self.content_hash = None
+                self.reload()
+            self.last_access = time.time()
+
+            if self.document_handle is not None:
+                self.document_handle.release()
+
+            self.document_handle = handle
+            self.content_hash = handle.content_hash
+            self.chat_agent.rag_engine = handle.rag_engine
+            self.chat_agent.set_document(handle.document_data)
+
+    def estimate_memory_bytes(self) -> int:
+        """Bytes held only by this session, excluding the shared document"""
+        size = sum(len(message["content"]) for message in self.messages)
+        return size + self.chat_agent.conversation_memory.estimate_memory_bytes()
+
+    def spill(self) -> bool:
+        """Write messages and history to disk and drop document references"""
+        if not self.lock.acquire(blocking=False):
+            return False
+
+        try:
+            if self.spilled:
+                return False
+
+            write_spill(self.spill_path, {
+                "messages": self.messages,
+                "conversation": self.chat_agent.conversation_memory.to_state()
+            })
+
+            # The shared document is reloaded through the registry by content hash
+            if self.document_handle is not None:
+                self.document_handle.release()
+            self.document_handle = None
+            self.chat_agent.rag_engine = None
+            self.chat_agent.current_document = None
+            self.chat_agent.conversation_memory.clear()
+            self.messages = []
+            self.spilled = True
+            return True
+        finally:
+            self.lock.release()
+
+    def reload(self) -> None:
+        """Restore spilled state; a no-op for resident sessions"""
+        with self.lock:
+            if not self.spilled:
+                return
+
+            self.spilled = False
+            try:
+                state, _ = read_spill(self.spill_path)
+                self.messages = state["messages"]
+                self.chat_agent.conversation_memory.load_state(state["conversation"])
+            except Exception:
+                # Spill file deleted or unreadable: the chat history is lost, but the session keeps working
+                self.messages = []
+                self.chat_agent.conversation_memory.clear()
+            remove_file(self.spill_path)
+
+            if self.content_hash is not None:
+                handle = self.registry.acquire(self.content_hash)
+                if handle is None:
+                    # Spilled document expired from disk; the user must upload it again
+                    self.content_hash = None
+                    return
+                self.document_handle = handle
+                self.chat_agent.rag_engine = handle.rag_engine
+                self.chat_agent.current_document = handle.document_data
+
+class MemoryGovernor:
+    """Process-wide governor that keeps memory under MEMORY_CEILING_MB by spilling idle sessions"""
+
+    def __init__(self, registry: DocumentRegistry, ceiling_bytes: Optional[int] = None, spill_dir: Optional[str] = None):
+        self.config = Config()
+        self.registry = registry
+        self.ceiling_bytes = ceiling_bytes or self.config.MEMORY_CEILING_MB * 1024 * 1024
+        # Private to this process: session spills cannot outlive the process that wrote them
+        self.spill_dir = create_spill_dir(self, "sessions", spill_dir or self.config.SPILL_DIR)
+        self.lock = threading.Lock()
+        # Weak references: a workspace disappears with its Streamlit session
+        self.sessions = weakref.WeakValueDictionary()
+        self.last_cleanup = 0.0
+
+    def create_workspace(self, chat_agent) -> SessionWorkspace:
+        """Create and track the workspace for a new session"""
+        workspace = SessionWorkspace(chat_agent, self.registry, self.spill_dir)
+        with self.lock:
+            self.sessions[workspace.session_id] = workspace
+        return workspace
+
+    def session_footprints(self) -> Dict[str, int]:
+        """Estimated bytes per session, counting a share of each referenced document"""
+        with self.lock:
+            workspaces = list(self.sessions.values())
+
+        refs: Dict[str, int] = {}
+        for workspace in workspaces:
+            if workspace.document_handle is not None:
+                refs[workspace.content_hash] = refs.get(workspace.content_hash, 0) + 1
+
+        footprints = {}
+        for workspace in workspaces:
+            size = workspace.estimate_memory_bytes()
+            entry = self.registry.entries.get(workspace.content_hash)
+            if workspace.document_handle is not None and entry is not None:
+                size += entry["size"] // refs[workspace.content_hash]
+            footprints[workspace.session_id] = size
+        return footprints
+
+    def tracked_bytes(self) -> int:
+        """Estimated bytes held by sessions and the document registry"""
+        with self.lock:
+            workspaces = list(self.sessions.values())
+        return self.registry.total_bytes() + sum(workspace.estimate_memory_bytes() for workspace in workspaces)
+
+    def enforce(self, current: Optional[SessionWorkspace] = None) -> None:
+        """Spill idle sessions, then least recently used ones while over the ceiling"""
+        now = time.time()
+        with self.lock:
+            candidates = sorted(
+                (
+                    workspace for workspace in self.sessions.values()
+                    if workspace is not current and not workspace.spilled
+                ),
+                key=lambda workspace: workspace.last_access
+            )
+
+        for workspace in candidates:
+            if now - workspace.last_access >= self.config.SESSION_IDLE_SECONDS:
+                workspace.spill()
+
+        rss = current_rss_bytes() or self.tracked_bytes()
+        if rss > self.ceiling_bytes:
+            excess = rss - self.ceiling_bytes
+            before = self.tracked_bytes()
+            registry_target = max(0, self.registry.total_bytes() - excess)
+
+            for workspace in candidates:
+                if before - self.tracked_bytes() >= excess:
+                    break
+                if workspace.spilled or now - workspace.last_access < self.config.SESSION_MIN_IDLE_SECONDS:
+                    continue
+                workspace.spill()
+                # Released documents nobody else references go to disk as well
+                self.registry.evict(max_bytes=registry_target)
+
+            gc.collect()
+
+        if now - self.last_cleanup > self.config.SPILL_CLEANUP_INTERVAL:
+            self.last_cleanup = now
+            self.registry.remove_stale_spills(self.config.SPILL_RETENTION)
+
+@st.cache_resource
+def get_memory_governor() -> MemoryGovernor:
+    """Shared memory governor for every session in this process"""
+    return MemoryGovernor(get_document_registry())
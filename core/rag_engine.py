@@ -4,53 +4,62 @@ from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Optional, Tuple
 import streamlit as st
 from config import Config
+from utils.progress import ProgressCallback, streamlit_progress_callback
+
+@st.cache_resource
+def load_embedding_model() -> SentenceTransformer:
+    """Load the sentence embedding model once per process"""
+    return SentenceTransformer(Config.EMBEDDING_MODEL)
 
 class OptimizedRAGEngine:
-    def __init__(self):
+    def __init__(self, embedding_model: Optional[SentenceTransformer] = None):
         self.config = Config()
-        self.embedding_model = SentenceTransformer(self.config.EMBEDDING_MODEL)
+        self.embedding_model = embedding_model or load_embedding_model()
         self.vector_index = None
         self.chunks = []
         self.chunk_metadata = []
+        # Two-level retrieval for large documents: sections first, then their chunks
+        self.section_index = None
+        self.section_chunk_positions = []
+        self.section_title_embeddings = {}
         
-    def create_embeddings(self, chunks: List[Dict]) -> None:
+    def create_embeddings(self, chunks: List[Dict], progress_callback: Optional[ProgressCallback] = None) -> None:
         """Create embeddings for document chunks with progress tracking"""
         if not chunks:
             return
         
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        if progress_callback is None:
+            progress_callback = streamlit_progress_callback()
         
-        # Extract text from chunks
-        texts = [chunk["text"] for chunk in chunks]
         self.chunks = chunks
+        embeddings = self.encode_texts([chunk["text"] for chunk in chunks], progress_callback)
+        
+        # Create optimized FAISS index
+        self.create_vector_index(embeddings)
+        self.build_section_index()
         
-        # Create embeddings in batches
+        progress_callback(1.0, "Embeddings created successfully!")
+    
+    def encode_texts(self, texts: List[str], progress_callback: ProgressCallback) -> np.ndarray:
+        """Encode texts in batches, reporting progress per batch"""
         all_embeddings = []
         batch_size = self.config.BATCH_SIZE
         
         for i in range(0, len(texts), batch_size):
             batch = texts[i:i + batch_size]
-            status_text.text(f"Creating embeddings: {i//batch_size + 1}/{(len(texts)//batch_size) + 1}")
+            progress_callback(i / len(texts), f"Creating embeddings: {i//batch_size + 1}/{(len(texts)//batch_size) + 1}")
             
             batch_embeddings = self.embedding_model.encode(batch, show_progress_bar=False)
             all_embeddings.append(batch_embeddings)
-            
-            progress_bar.progress(min(1.0, (i + batch_size) / len(texts)))
         
         # Combine all embeddings
-        embeddings = np.vstack(all_embeddings)
-        
-        # Create optimized FAISS index
-        self.create_vector_index(embeddings)
-        
-        status_text.text("Embeddings created successfully!")
+        return np.vstack(all_embeddings).astype('float32')
     
     def create_vector_index(self, embeddings: np.ndarray) -> None:
         """Create optimized FAISS index based on data size"""
         dimension = embeddings.shape[1]
         
-        if len(embeddings) > 1000:
+        if len(embeddings) > self.config.IVF_THRESHOLD:
             # Use IVF for large datasets
             nlist = min(100, len(embeddings) // 10)
             quantizer = faiss.IndexFlatL2(dimension)
@@ -59,6 +68,8 @@ class OptimizedRAGEngine:
             # Train the index
             self.vector_index.train(embeddings.astype('float32'))
             self.vector_index.nprobe = 10  # Search more clusters
+            # Allow reconstructing stored vectors for incremental updates
+            self.vector_index.make_direct_map()
         else:
             # Use flat index for smaller datasets
             self.vector_index = faiss.IndexFlatL2(dimension)
@@ -66,41 +77,266 @@ class OptimizedRAGEngine:
         # Add vectors to index
         self.vector_index.add(embeddings.astype('float32'))
     
+    def reconstruct_embeddings(self) -> np.ndarray:
+        """Read the stored chunk vectors back out of the index"""
+        return self.vector_index.reconstruct_n(0, self.vector_index.ntotal)
+    
+    def clone(self) -> "OptimizedRAGEngine":
+        """Copy the chunk store and index so a new revision can be updated without touching this one"""
+        engine = OptimizedRAGEngine(embedding_model=self.embedding_model)
+        engine.chunks = [dict(chunk) for chunk in self.chunks]
+        if self.vector_index is not None:
+            engine.vector_index = faiss.clone_index(self.vector_index)
+            if isinstance(engine.vector_index, faiss.IndexIVF):
+                engine.vector_index.make_direct_map()
+        if self.section_index is not None:
+            engine.section_index = faiss.clone_index(self.section_index)
+        engine.section_chunk_positions = list(self.section_chunk_positions)
+        engine.section_title_embeddings = dict(self.section_title_embeddings)
+        return engine
+    
+    def apply_incremental_update(
+        self,
+        retained_positions: List[int],
+        new_chunks: List[Dict],
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> None:
+        """Keep retained chunks, embed only the new ones and update the index in place"""
+        if progress_callback is None:
+            progress_callback = streamlit_progress_callback()
+        
+        retained_positions = sorted(retained_positions)
+        retained = set(retained_positions)
+        removed = [i for i in range(len(self.chunks)) if i not in retained]
+        
+        new_embeddings = None
+        if new_chunks:
+            new_embeddings = self.encode_texts([chunk["text"] for chunk in new_chunks], progress_callback)
+        
+        total = len(retained_positions) + len(new_chunks)
+        is_ivf = isinstance(self.vector_index, faiss.IndexIVF)
+        
+        if self.vector_index is None or total == 0 or is_ivf != (total > self.config.IVF_THRESHOLD):
+            # Index type changes with size; rebuild from stored vectors without re-encoding
+            parts = []
+            if self.vector_index is not None and retained_positions:
+                parts.append(self.reconstruct_embeddings()[retained_positions])
+            if new_embeddings is not None:
+                parts.append(new_embeddings)
+            self.vector_index = None
+            if parts:
+                self.create_vector_index(np.vstack(parts))
+        elif is_ivf:
+            # Keep the trained coarse quantizer; only the inverted lists are refilled
+            kept_embeddings = self.reconstruct_embeddings()[retained_positions]
+            self.vector_index.reset()
+            self.vector_index.add(kept_embeddings)
+            if new_embeddings is not None:
+                self.vector_index.add(new_embeddings)
+        else:
+            # Flat index compacts in order, matching the retained chunk order
+            if removed:
+                self.vector_index.remove_ids(np.array(removed, dtype='int64'))
+            if new_embeddings is not None:
+                self.vector_index.add(new_embeddings)
+        
+        self.chunks = [self.chunks[i] for i in retained_positions] + new_chunks
+        self.build_section_index()
+        progress_callback(1.0, "Index updated successfully!")
+    
+    def build_section_index(self) -> None:
+        """Index one vector per section (title embedding blended with the chunk centroid)"""
+        self.section_index = None
+        self.section_chunk_positions = []
+        
+        if self.vector_index is None or len(self.chunks) < self.config.HIERARCHICAL_MIN_CHUNKS:
+            return
+        
+        # Group chunk positions by section; titles can repeat, so prefer the section fingerprint.
+        # A collapsed duplicate belongs to every section it occurs in.
+        groups = {}
+        for position, chunk in enumerate(self.chunks):
+            for occurrence in chunk.get("occurrences") or [chunk]:
+                key = occurrence.get("section_hash") or occurrence["section"]
+                positions = groups.setdefault(key, (occurrence["section"], []))[1]
+                if not positions or positions[-1] != position:
+                    positions.append(position)
+        
+        if len(groups) < self.config.HIERARCHICAL_MIN_SECTIONS:
+            return
+        
+        titles = [title for title, _ in groups.values()]
+        missing_titles = sorted(set(titles) - set(self.section_title_embeddings))
+        if missing_titles:
+            title_embeddings = self.embedding_model.encode(
+                missing_titles,
+                batch_size=self.config.BATCH_SIZE,
+                show_progress_bar=False
+            ).astype('float32')
+            self.section_title_embeddings.update(zip(missing_titles, title_embeddings))
+        
+        # Oversized sections are split into blocks so the top sections never exceed the candidate budget
+        block_size = max(1, self.config.HIERARCHICAL_MAX_CANDIDATES // self.config.HIERARCHICAL_TOP_SECTIONS)
+        chunk_embeddings = self.reconstruct_embeddings()
+        section_vectors = []
+        for title, positions in groups.values():
+            for start in range(0, len(positions), block_size):
+                block = positions[start:start + block_size]
+                centroid = chunk_embeddings[block].mean(axis=0)
+                section_vectors.append((centroid + self.section_title_embeddings[title]) / 2)
+                self.section_chunk_positions.append(np.array(block, dtype='int64'))
+        
+        self.section_index = faiss.IndexFlatL2(chunk_embeddings.shape[1])
+        self.section_index.add(np.vstack(section_vectors).astype('float32'))
+    
+    def to_state(self) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        """JSON-safe metadata and numpy arrays describing the chunk store and index"""
+        titles = sorted(self.section_title_embeddings)
+        metadata = {"chunks": self.chunks, "section_titles": titles}
+        arrays = {}
+        if self.vector_index is not None:
+            arrays["index"] = faiss.serialize_index(self.vector_index)
+        if titles:
+            arrays["section_title_embeddings"] = np.vstack([self.section_title_embeddings[title] for title in titles])
+        return metadata, arrays
+    
+    @classmethod
+    def from_state(
+        cls,
+        metadata: Dict,
+        arrays: Dict[str, np.ndarray],
+        embedding_model: Optional[SentenceTransformer] = None
+    ) -> "OptimizedRAGEngine":
+        """Rebuild an engine from a to_state snapshot"""
+        engine = cls(embedding_model=embedding_model)
+        engine.chunks = metadata["chunks"]
+        if "index" in arrays:
+            engine.vector_index = faiss.deserialize_index(arrays["index"])
+            if isinstance(engine.vector_index, faiss.IndexIVF):
+                engine.vector_index.make_direct_map()
+        if "section_title_embeddings" in arrays:
+            engine.section_title_embeddings = dict(zip(metadata["section_titles"], arrays["section_title_embeddings"]))
+        engine.build_section_index()
+        return engine
+    
+    def estimate_memory_bytes(self) -> int:
+        """Rough in-memory size of the index and chunk store"""
+        size = sum(len(chunk["text"]) for chunk in self.chunks)
+        if self.vector_index is not None:
+            size += self.vector_index.ntotal * self.vector_index.d * 4
+        if self.section_index is not None:
+            size += self.section_index.ntotal * self.section_index.d * 4 + len(self.chunks) * 8
+        return size
+    
     def search_similar_chunks(self, query: str, top_k: int = 8) -> List[Dict]:
         """Advanced similarity search with reranking"""
-        if not self.vector_index or not self.chunks:
-            return []
+        results = self.search_batch([query], top_k=top_k)
+        return results[0] if results else []
+    
+    def search_batch(self, queries: List[str], top_k: int = 8) -> List[List[Dict]]:
+        """Search several queries with one encode pass and one index search"""
+        if not self.vector_index or not self.chunks or not queries:
+            return [[] for _ in queries]
         
         try:
-            # Get query embedding
-            query_embedding = self.embedding_model.encode([query])
+            # Encode all queries in a single forward pass
+            query_embeddings = self.embedding_model.encode(
+                queries,
+                batch_size=self.config.BATCH_SIZE,
+                show_progress_bar=False
+            )
             
             # Search with higher k for reranking
             search_k = min(top_k * 2, len(self.chunks))
-            distances, indices = self.vector_index.search(
-                query_embedding.astype('float32'), 
-                search_k
-            )
-            
-            # Prepare results with metadata
-            results = []
-            for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-                if idx < len(self.chunks):
-                    chunk = self.chunks[idx]
-                    results.append({
-                        "chunk": chunk,
-                        "similarity_score": 1 / (1 + distance),  # Convert distance to similarity
-                        "rank": i + 1
-                    })
+            distances, indices = self.search_index(query_embeddings.astype('float32'), search_k)
             
-            # Rerank results
-            reranked_results = self.rerank_results(results, query)
-            
-            return reranked_results[:top_k]
+            return [
+                self.rerank_results(self.build_results(distances[row], indices[row]), query)[:top_k]
+                for row, query in enumerate(queries)
+            ]
             
         except Exception as e:
             st.error(f"Search error: {str(e)}")
-            return []
+            return [[] for _ in queries]
+    
+    def search_fused(self, paraphrases: List[str], top_k: int = 8) -> List[Dict]:
+        """Search paraphrases of one question and fuse them with reciprocal rank fusion"""
+        result_sets = self.search_batch(paraphrases, top_k=top_k * 2)
+        
+        fused = {}
+        for results in result_sets:
+            for rank, result in enumerate(results, 1):
+                entry = fused.setdefault(result["chunk_index"], {
+                    "chunk": result["chunk"],
+                    "chunk_index": result["chunk_index"],
+                    "similarity_score": result["similarity_score"],
+                    "final_score": 0.0
+                })
+                entry["similarity_score"] = max(entry["similarity_score"], result["similarity_score"])
+                entry["final_score"] += 1 / (self.config.FUSION_RANK_CONSTANT + rank)
+        
+        fused_results = sorted(fused.values(), key=lambda x: x["final_score"], reverse=True)
+        for rank, result in enumerate(fused_results, 1):
+            result["rank"] = rank
+        
+        return fused_results[:top_k]
+    
+    def search_index(self, query_embeddings: np.ndarray, search_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest chunks per query, searching only the best sections when a section index exists"""
+        if self.section_index is None:
+            return self.vector_index.search(query_embeddings, search_k)
+        
+        top_sections = min(self.config.HIERARCHICAL_TOP_SECTIONS, self.section_index.ntotal)
+        _, section_ids = self.section_index.search(query_embeddings, top_sections)
+        
+        distances = np.full((len(query_embeddings), search_k), np.inf, dtype='float32')
+        indices = np.full((len(query_embeddings), search_k), -1, dtype='int64')
+        fallback_rows = []
+        
+        for row, query_embedding in enumerate(query_embeddings):
+            # Take the best sections until the candidate budget is filled; the budget is a hard cap
+            candidate_groups = []
+            candidate_count = 0
+            for section_id in section_ids[row]:
+                remaining = self.config.HIERARCHICAL_MAX_CANDIDATES - candidate_count
+                if section_id < 0 or remaining <= 0:
+                    break
+                candidate_groups.append(self.section_chunk_positions[section_id][:remaining])
+                candidate_count += len(candidate_groups[-1])
+            
+            if candidate_count < search_k:
+                fallback_rows.append(row)
+                continue
+            
+            positions = np.unique(np.concatenate(candidate_groups))
+            vectors = self.vector_index.reconstruct_batch(positions)
+            candidate_distances = ((vectors - query_embedding) ** 2).sum(axis=1)
+            best = np.argsort(candidate_distances)[:search_k]
+            distances[row] = candidate_distances[best]
+            indices[row] = positions[best]
+        
+        # Too few candidates in the chosen sections: use the flat search for those queries
+        if fallback_rows:
+            flat_distances, flat_indices = self.vector_index.search(query_embeddings[fallback_rows], search_k)
+            distances[fallback_rows] = flat_distances
+            indices[fallback_rows] = flat_indices
+        
+        return distances, indices
+    
+    def build_results(self, distances: np.ndarray, indices: np.ndarray) -> List[Dict]:
+        """Prepare results with metadata from one row of index search output"""
+        results = []
+        for i, (distance, idx) in enumerate(zip(distances, indices)):
+            if 0 <= idx < len(self.chunks):
+                chunk = self.chunks[idx]
+                results.append({
+                    "chunk": chunk,
+                    "chunk_index": int(idx),
+                    "similarity_score": 1 / (1 + distance),  # Convert distance to similarity
+                    "rank": i + 1
+                })
+        
+        return results
     
     def rerank_results(self, results: List[Dict], query: str) -> List[Dict]:
         """Rerank results based on multiple factors"""
@@ -0,0 +1,164 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+class StubSettings:
+    """Latency and response shape of the stand-in chat completions endpoint"""
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        token_delay: float = 0.02,
+        response_tokens: int = 200,
+        jitter: float = 0.2,
+        error_rate: float = 0.0
+    ):
+        self.latency = latency  # seconds before the first byte
+        self.token_delay = token_delay  # seconds between generated tokens
+        self.response_tokens = response_tokens
+        self.jitter = jitter  # +/- fraction applied to every delay
+        self.error_rate = error_rate  # share of requests answered with HTTP 500
+
+    def delay(self, seconds: float) -> float:
+        """Apply jitter to a configured delay"""
+        return max(0.0, seconds * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+class GroqStubHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions handler, streaming or not, as the Groq SDK expects"""
+
+    settings = StubSettings()
+
+    def log_message(self, format, *args):
+        # Per-request logging would dominate the output of a load test
+        pass
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if random.random() < self.settings.error_rate:
+            self.send_json(500, {"error": {"message": "Injected stub failure"}})
+            return
+
+        prompt_chars = sum(len(message.get("content") or "") for message in request.get("messages", []))
+        model = request.get("model", "stub-model")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        tokens = [f"token{i} " for i in range(self.settings.response_tokens)]
+
+        time.sleep(self.settings.delay(self.settings.latency))
+
+        if request.get("stream"):
+            self.stream_completion(completion_id, model, tokens)
+            return
+
+        time.sleep(self.settings.delay(self.settings.token_delay * len(tokens)))
+        self.send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                "logprobs": None,
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_chars // 4 + len(tokens)
+            }
+        })
+
+    def stream_completion(self, completion_id: str, model: str, tokens) -> None:
+        """Send tokens as server-sent events, one chunk per token"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        for i, token in enumerate(tokens):
+            delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+            self.send_event(self.stream_chunk(completion_id, model, delta, None))
+            time.sleep(self.settings.delay(self.settings.token_delay))
+
+        self.send_event(self.stream_chunk(completion_id, model, {}, "stop"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def stream_chunk(self, completion_id: str, model: str, delta: Dict, finish_reason: Optional[str]) -> Dict:
+        """One chat.completion.chunk payload"""
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}]
+        }
+
+    def send_event(self, payload: Dict) -> None:
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def send_json(self, status: int, payload: Dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def create_stub_server(settings: StubSettings, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Build a threaded stub server; port 0 picks a free port"""
+    handler = type("ConfiguredGroqStubHandler", (GroqStubHandler,), {"settings": settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def start_stub_server(settings: StubSettings, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serve the stub on a background thread"""
+    server = create_stub_server(settings, host, port)
+    threading.Thread(target=server.serve_forever, name="groq-stub", daemon=True).start()
+    return server
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    """Command-line options shared by the stub and the load test runner"""
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before the first byte of a reply")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between generated tokens")
+    parser.add_argument("--response-tokens", type=int, default=200, help="tokens per reply")
+    parser.add_argument("--jitter", type=float, default=0.2, help="+/- fraction applied to every delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failed with HTTP 500")
+
+def settings_from_args(args: argparse.Namespace) -> StubSettings:
+    """Build stub settings from parsed add_stub_arguments options"""
+    return StubSettings(
+        latency=args.latency,
+        token_delay=args.token_delay,
+        response_tokens=args.response_tokens,
+        jitter=args.jitter,
+        error_rate=args.error_rate
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Groq chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server = create_stub_server(settings_from_args(args), args.host, args.port)
+    print(f"Groq stub listening on http://{args.host}:{args.port} (set GROQ_BASE_URL to this address)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
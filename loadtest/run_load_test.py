@@ -0,0 +1,392 @@
+import argparse
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from config import Config
+from core.chat_agent import AdvancedChatAgent
+from core.document_registry import DocumentHandle, compute_content_hash, get_document_registry, new_document_id
+from core.ingestion_worker import IngestionJob, IngestionQueueFull, get_ingestion_worker
+from core.memory_governor import current_rss_bytes, get_memory_governor
+from loadtest.groq_stub import add_stub_arguments, settings_from_args, start_stub_server
+
+DEFAULT_SCRIPT = [
+    "How do I get started?",
+    "What are the main features?",
+    "How do I configure the settings?",
+    "What should I do if I get an error?",
+    "Can you show me an example?"
+]
+
+class StageRecorder:
+    """Thread-safe latency samples per pipeline stage"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.revisions: List[Dict[str, int]] = []
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def error(self, stage: str) -> None:
+        with self.lock:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def revision(self, job: IngestionJob) -> None:
+        """Chunks a revision upload re-embedded versus reused from the previous revision"""
+        with self.lock:
+            self.revisions.append({"embedded": job.embedded_chunks, "reused": job.reused_chunks})
+
+    def summary(self) -> Dict[str, Dict]:
+        """Count and p50/p95/p99/max latency per stage"""
+        with self.lock:
+            return {
+                stage: {
+                    "count": len(values),
+                    "p50": float(np.percentile(values, 50)),
+                    "p95": float(np.percentile(values, 95)),
+                    "p99": float(np.percentile(values, 99)),
+                    "max": float(max(values))
+                }
+                for stage, values in self.samples.items()
+            }
+
+class TimedSearchEngine:
+    """Wraps a RAG engine so the agent's retrieval step is timed separately"""
+
+    def __init__(self, rag_engine, recorder: StageRecorder):
+        self.rag_engine = rag_engine
+        self.recorder = recorder
+
+    def search_similar_chunks(self, query: str, top_k: int = 8) -> List[Dict]:
+        start = time.perf_counter()
+        results = self.rag_engine.search_similar_chunks(query, top_k=top_k)
+        self.recorder.record("retrieval", time.perf_counter() - start)
+        return results
+
+class RecordingCompletions:
+    """Stands in for client.chat.completions so API failures are counted from the raised exception"""
+
+    def __init__(self, completions, recorder: StageRecorder):
+        self.completions = completions
+        self.recorder = recorder
+        self.failures = 0
+
+    def create(self, **kwargs):
+        try:
+            response = self.completions.create(**kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        if kwargs.get("stream"):
+            return self.record_stream(response)
+        return response
+
+    def record_stream(self, stream):
+        # Errors can also surface part-way through a streamed response
+        try:
+            yield from stream
+        except Exception as e:
+            self.record_failure(e)
+            raise
+
+    def record_failure(self, error: Exception) -> None:
+        self.failures += 1
+        self.recorder.error(f"chat_api_{type(error).__name__}")
+
+def instrument_agent(agent: AdvancedChatAgent, args, recorder: StageRecorder) -> RecordingCompletions:
+    """Give the agent a client with the configured retry count whose failures are recorded"""
+    # The SDK retries 5xx responses with backoff by default, which hides errors inside latency
+    client = agent.client.with_options(max_retries=args.max_retries)
+    completions = RecordingCompletions(client.chat.completions, recorder)
+    agent.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return completions
+
+def ingest_document(
+    file_bytes: bytes,
+    file_name: str,
+    document_id: str,
+    args,
+    recorder: StageRecorder,
+    registry,
+    worker,
+    stage: str = "ingest"
+) -> Tuple[Optional[DocumentHandle], Optional[IngestionJob]]:
+    """Attach to a processed document the way the app does, ingesting it first if needed
+
+    Returns the handle (None on failure) and the ingestion job (None on a registry hit).
+    """
+    start = time.perf_counter()
+    content_hash = compute_content_hash(file_bytes)
+    handle = registry.acquire(content_hash)
+    job = None
+
+    if handle is not None:
+        registry.record_revision(document_id, content_hash)
+    else:
+        while True:
+            try:
+                job_id = worker.submit(file_bytes, file_name, content_hash=content_hash, document_id=document_id)
+                break
+            except IngestionQueueFull:
+                recorder.error("ingest_queue_full")
+                time.sleep(args.poll_interval)
+
+        job = worker.get_job(job_id)
+        while not job.done:
+            time.sleep(args.poll_interval)
+
+        # The registry may have evicted the entry again if memory is very tight
+        handle = registry.acquire(content_hash) if job.status == IngestionJob.COMPLETED else None
+        if handle is None:
+            recorder.error(stage)
+            return None, job
+
+    recorder.record(stage, time.perf_counter() - start)
+    return handle, job
+
+def run_chat_turn(workspace, completions: RecordingCompletions, question: str, args, recorder: StageRecorder) -> None:
+    """Ask one question the way the Streamlit app does, timing each stage"""
+    agent = workspace.chat_agent
+    rag_engine = agent.rag_engine
+    agent.rag_engine = TimedSearchEngine(rag_engine, recorder)
+    failures = completions.failures
+
+    try:
+        workspace.messages.append({"role": "user", "content": question})
+        start = time.perf_counter()
+
+        if args.stream:
+            response = ""
+            for piece in agent.generate_streaming_response(question):
+                # The agent yields its error message as a piece; that is not a first token
+                if not response and completions.failures == failures:
+                    recorder.record("first_token", time.perf_counter() - start)
+                response += piece
+        else:
+            response = agent.generate_response(question)
+
+        # Failed turns are kept out of the chat_turn latency percentiles
+        failed = completions.failures > failures
+        recorder.record("chat_turn_failed" if failed else "chat_turn", time.perf_counter() - start)
+        if failed:
+            recorder.error("chat_turn")
+        workspace.messages.append({"role": "assistant", "content": response})
+    finally:
+        agent.rag_engine = rag_engine
+
+def run_session(
+    index: int,
+    pdf_bytes: bytes,
+    revision_bytes: Optional[bytes],
+    script: List[str],
+    args,
+    recorder: StageRecorder,
+    services: Dict
+):
+    """One simulated user: upload, work through the chat script, then optionally upload a revision"""
+    time.sleep(args.ramp_up * index / max(1, args.sessions))
+    session_start = time.perf_counter()
+
+    file_name = os.path.basename(args.pdf)
+    suffix = b""
+    if args.unique_documents:
+        # Trailing PDF comment: same content, distinct bytes, so no cross-session sharing
+        suffix = f"\n%loadtest-session-{index}\n".encode("ascii")
+        file_name = f"{index}-{file_name}"
+
+    document_id = new_document_id()
+    handle, _ = ingest_document(
+        pdf_bytes + suffix, file_name, document_id, args, recorder, services["registry"], services["worker"]
+    )
+    if handle is None:
+        return None
+
+    agent = AdvancedChatAgent(None)
+    completions = instrument_agent(agent, args, recorder)
+    workspace = services["governor"].create_workspace(agent)
+    workspace.attach(handle)
+
+    for question in script:
+        services["governor"].enforce(current=workspace)
+        with workspace.active():
+            run_chat_turn(workspace, completions, question, args, recorder)
+        time.sleep(args.think_time)
+
+    if revision_bytes is not None:
+        # Same document id, like the app's "new revision" upload: only changed pages are re-embedded
+        handle, job = ingest_document(
+            revision_bytes + suffix, file_name, document_id, args, recorder,
+            services["registry"], services["worker"], stage="revision"
+        )
+        if handle is not None:
+            if job is not None:
+                recorder.revision(job)
+            with workspace.active():
+                workspace.attach(handle)
+                run_chat_turn(workspace, completions, script[0], args, recorder)
+
+    recorder.record("session", time.perf_counter() - session_start)
+    return workspace
+
+def format_report(report: Dict) -> str:
+    """Human-readable summary of a load test run"""
+    lines = [
+        f"Sessions: {report['sessions']} completed of {report['sessions_requested']} "
+        f"in {report['duration']:.1f}s",
+        f"Throughput: {report['sessions_per_second']:.2f} sessions/s, "
+        f"{report['chat_turns_per_second']:.2f} successful chat turns/s",
+        "",
+        f"{'stage':<18}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}"
+    ]
+    for stage, stats in report["stages"].items():
+        lines.append(
+            f"{stage:<18}{stats['count']:>7}{stats['p50']:>9.3f}s{stats['p95']:>9.3f}s"
+            f"{stats['p99']:>9.3f}s{stats['max']:>9.3f}s"
+        )
+
+    memory = report["memory"]
+    lines += [
+        "",
+        f"RSS: start {memory['rss_start_mb']:.0f} MB, end {memory['rss_end_mb']:.0f} MB, "
+        f"peak {memory['rss_peak_mb']:.0f} MB",
+        f"Per session: {memory['rss_delta_per_session_mb']:.2f} MB RSS growth, "
+        f"{memory['footprint_p50_mb']:.2f} MB estimated footprint (p50), "
+        f"{memory['footprint_max_mb']:.2f} MB (max)"
+    ]
+    revisions = report["revisions"]
+    if revisions["count"]:
+        lines += [
+            "",
+            f"Revisions: {revisions['count']} re-indexed, {revisions['embedded_p50']:.0f} chunks re-embedded "
+            f"and {revisions['reused_p50']:.0f} reused (p50), {revisions['embedded_max']} re-embedded (max)"
+        ]
+    if report["errors"]:
+        lines += ["", "Errors: " + ", ".join(f"{stage}={count}" for stage, count in report["errors"].items())]
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Drive concurrent simulated DocuGPT sessions (ingest plus chat) against a local Groq stand-in"
+    )
+    parser.add_argument("--pdf", required=True, help="PDF uploaded by every simulated session")
+    parser.add_argument("--revision-pdf", help="revised PDF each session uploads as a new revision after its script")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated sessions")
+    parser.add_argument("--script", help="text file with one chat question per line")
+    parser.add_argument("--stream", action="store_true", help="use the streaming chat path")
+    parser.add_argument("--unique-documents", action="store_true", help="give every session distinct upload bytes")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="seconds over which sessions start")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds between a session's questions")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="seconds between ingestion status polls")
+    parser.add_argument("--base-url", help="existing Groq-compatible endpoint; starts a local stub if omitted")
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=0,
+        help="Groq client retries per request; the SDK default of 2 hides failures as latency"
+    )
+    parser.add_argument("--json", help="also write the report as JSON to this path")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    # Streamlit APIs run without a script context here and warn on every call
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    stub_server = None
+    if args.base_url is None:
+        stub_server = start_stub_server(settings_from_args(args))
+        args.base_url = f"http://127.0.0.1:{stub_server.server_address[1]}"
+    Config.GROQ_BASE_URL = args.base_url
+    Config.GROQ_API_KEY = Config.GROQ_API_KEY or "loadtest"
+
+    with open(args.pdf, "rb") as f:
+        pdf_bytes = f.read()
+
+    revision_bytes = None
+    if args.revision_pdf:
+        with open(args.revision_pdf, "rb") as f:
+            revision_bytes = f.read()
+
+    script = DEFAULT_SCRIPT
+    if args.script:
+        with open(args.script) as f:
+            script = [line.strip() for line in f if line.strip()]
+
+    # Loads the embedding model before timing starts
+    services = {
+        "registry": get_document_registry(),
+        "worker": get_ingestion_worker(),
+        "governor": get_memory_governor()
+    }
+
+    recorder = StageRecorder()
+    rss_start = current_rss_bytes() or 0
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=args.sessions, thread_name_prefix="loadtest-session") as executor:
+        futures = [
+            executor.submit(run_session, index, pdf_bytes, revision_bytes, script, args, recorder, services)
+            for index in range(args.sessions)
+        ]
+        workspaces = []
+        for future in futures:
+            try:
+                workspace = future.result()
+            except Exception as e:
+                recorder.error(type(e).__name__)
+                continue
+            if workspace is not None:
+                workspaces.append(workspace)
+
+    duration = time.perf_counter() - start
+    rss_end = current_rss_bytes() or 0
+    footprints = services["governor"].session_footprints()
+    session_footprints = [footprints.get(workspace.session_id, 0) for workspace in workspaces] or [0]
+    stages = recorder.summary()
+    megabyte = 1024 * 1024
+
+    report = {
+        "sessions_requested": args.sessions,
+        "sessions": len(workspaces),
+        "duration": duration,
+        "sessions_per_second": len(workspaces) / duration,
+        "chat_turns_per_second": stages.get("chat_turn", {}).get("count", 0) / duration,
+        "stages": stages,
+        "memory": {
+            "rss_start_mb": rss_start / megabyte,
+            "rss_end_mb": rss_end / megabyte,
+            # ru_maxrss is reported in kilobytes on Linux
+            "rss_peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "rss_delta_per_session_mb": (rss_end - rss_start) / max(1, len(workspaces)) / megabyte,
+            "footprint_p50_mb": float(np.percentile(session_footprints, 50)) / megabyte,
+            "footprint_max_mb": max(session_footprints) / megabyte
+        },
+        "revisions": {
+            "count": len(recorder.revisions),
+            "embedded_p50": float(np.percentile([r["embedded"] for r in recorder.revisions], 50)) if recorder.revisions else 0.0,
+            "reused_p50": float(np.percentile([r["reused"] for r in recorder.revisions], 50)) if recorder.revisions else 0.0,
+            "embedded_max": max((r["embedded"] for r in recorder.revisions), default=0)
+        },
+        "errors": recorder.errors,
+        "settings": {key: value for key, value in vars(args).items()}
+    }
+
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if stub_server is not None:
+        stub_server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 import streamlit as st
 from config import Config
-from utils.pdf_processor import AdvancedPDFProcessor
-from core.rag_engine import OptimizedRAGEngine
 from core.chat_agent import AdvancedChatAgent
+from core.document_registry import DocumentHandle, compute_content_hash, get_document_registry, new_document_id
+from core.ingestion_worker import IngestionJob, IngestionQueueFull, get_ingestion_worker
+from core.memory_governor import SessionWorkspace, get_memory_governor
 
 # Page configuration
 st.set_page_config(
@@ -186,45 +187,126 @@ st.markdown("""
 
 def initialize_session_state():
     """Initialize session state variables"""
-    if 'pdf_processor' not in st.session_state:
-        st.session_state.pdf_processor = AdvancedPDFProcessor()
-    
-    if 'rag_engine' not in st.session_state:
-        st.session_state.rag_engine = OptimizedRAGEngine()
-    
-    if 'chat_agent' not in st.session_state:
-        st.session_state.chat_agent = AdvancedChatAgent(st.session_state.rag_engine)
-    
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
+    # Document, chat agent and messages live in the workspace so the memory governor can spill them
+    if 'workspace' not in st.session_state:
+        st.session_state.workspace = get_memory_governor().create_workspace(AdvancedChatAgent(None))
     
     if 'document_processed' not in st.session_state:
         st.session_state.document_processed = False
     
-    if 'current_document' not in st.session_state:
-        st.session_state.current_document = None
-    
     if 'show_upload' not in st.session_state:
         st.session_state.show_upload = False
+    
+    if 'ingestion_job_id' not in st.session_state:
+        st.session_state.ingestion_job_id = None
+    
+    # (level, message) left by a finished ingestion job for the next full run to show
+    if 'ingestion_notice' not in st.session_state:
+        st.session_state.ingestion_notice = None
+    
+    # Links revisions of the open document; kept in the URL so a later visit can upload the next revision
+    if 'document_id' not in st.session_state:
+        st.session_state.document_id = st.query_params.get("doc")
+    
+    if 'pending_document_id' not in st.session_state:
+        st.session_state.pending_document_id = None
+
+def attach_document(handle: DocumentHandle, document_id: str):
+    """Point this session at a shared, already processed document"""
+    st.session_state.workspace.attach(handle)
+    st.session_state.document_processed = True
+    st.session_state.show_upload = False
+    st.session_state.document_id = document_id
+    st.query_params["doc"] = document_id
+
+def end_ingestion(level: str, message: str):
+    """Leave the polling fragment and show the job's outcome on a full app run"""
+    st.session_state.ingestion_job_id = None
+    st.session_state.ingestion_notice = (level, message)
+    st.rerun()
+
+def show_ingestion_notice():
+    """Show the outcome of the last failed or cancelled ingestion once"""
+    notice = st.session_state.ingestion_notice
+    st.session_state.ingestion_notice = None
+    if notice is None:
+        return
+    
+    level, message = notice
+    if level == "warning":
+        st.warning(message)
+    else:
+        st.error(message)
+
+@st.fragment(run_every=Config.INGESTION_POLL_INTERVAL)
+def show_ingestion_status():
+    """Poll the background ingestion job and attach its result when done"""
+    # run_every keeps ticking until the next full run, even after the job has finished
+    if st.session_state.ingestion_job_id is None:
+        return
+    
+    # Fragment ticks skip main(), so hold the workspace here to keep it from being spilled mid-attach
+    with st.session_state.workspace.active():
+        poll_ingestion_job()
+
+def poll_ingestion_job():
+    """One status check of the current ingestion job"""
+    worker = get_ingestion_worker()
+    job = worker.get_job(st.session_state.ingestion_job_id)
+    
+    if job is None:
+        end_ingestion("error", "Document processing job expired. Please process the document again.")
+    
+    if job.status == IngestionJob.COMPLETED:
+        st.session_state.ingestion_job_id = None
+        handle = get_document_registry().acquire(job.content_hash)
+        if handle is None:
+            end_ingestion("error", "Processed document was evicted before it could be opened. Please process it again.")
+        attach_document(handle, st.session_state.pending_document_id)
+        st.toast(job.message)
+        st.rerun()
+    
+    if job.status == IngestionJob.FAILED:
+        end_ingestion("error", job.message)
+    
+    if job.status == IngestionJob.CANCELLED:
+        end_ingestion("warning", "Document processing was cancelled.")
+    
+    st.progress(job.progress, text=job.message)
+    
+    if st.button("✖ Cancel"):
+        worker.cancel(job.job_id)
+        st.session_state.ingestion_job_id = None
+        st.rerun()
 
 def main():
     """Main application function"""
     initialize_session_state()
+    workspace = st.session_state.workspace
+    get_memory_governor().enforce(current=workspace)
     
+    with workspace.active():
+        # A reloaded session whose document expired from disk has to upload it again
+        st.session_state.document_processed = workspace.document is not None
+        render_app(workspace)
+
+def render_app(workspace: SessionWorkspace):
+    """Render the upload flow and chat interface"""
     # Header
     st.markdown('<div class="chatgpt-header">🤖 DocuGPT</div>', unsafe_allow_html=True)
     
     # Main content container
     st.markdown('<div class="chat-container">', unsafe_allow_html=True)
     
-    # Show upload section if no document is processed
-    if not st.session_state.document_processed:
-        st.markdown("""
-        <div class="welcome-section">
-            <h1 class="welcome-title">Welcome to DocuGPT</h1>
-            <p class="welcome-subtitle">Upload a PDF document to start having intelligent conversations</p>
-        </div>
-        """, unsafe_allow_html=True)
+    # Show upload section if no document is processed, or the user is replacing it
+    if not st.session_state.document_processed or st.session_state.show_upload:
+        if not st.session_state.document_processed:
+            st.markdown("""
+            <div class="welcome-section">
+                <h1 class="welcome-title">Welcome to DocuGPT</h1>
+                <p class="welcome-subtitle">Upload a PDF document to start having intelligent conversations</p>
+            </div>
+            """, unsafe_allow_html=True)
         
         # File upload
         uploaded_file = st.file_uploader(
@@ -237,27 +319,48 @@ def main():
             file_size = len(uploaded_file.getvalue()) / (1024 * 1024)
             st.success(f"✅ File loaded: {file_size:.1f}MB")
             
-            if st.button("🚀 Process Document"):
-                with st.spinner("Processing document..."):
-                    try:
-                        document_data = st.session_state.pdf_processor.extract_text_with_structure(uploaded_file)
-                        
-                        if document_data:
-                            chunks = st.session_state.pdf_processor.create_intelligent_chunks(document_data)
-                            st.session_state.rag_engine.create_embeddings(chunks)
-                            st.session_state.chat_agent.set_document(document_data)
-                            st.session_state.current_document = document_data
-                            st.session_state.document_processed = True
-                            st.success("✅ Document processed successfully!")
-                            st.rerun()
-                        
-                    except Exception as e:
-                        st.error(f"Error processing document: {str(e)}")
+            # Only an explicit revision is diffed against an earlier upload
+            revision_of = None
+            if st.session_state.document_id is not None and st.checkbox(
+                "This is a new revision of the previous document (only changed pages are re-processed)",
+                value=True
+            ):
+                revision_of = st.session_state.document_id
+            
+            if st.session_state.ingestion_job_id is None and st.button("🚀 Process Document"):
+                try:
+                    file_bytes = uploaded_file.getvalue()
+                    content_hash = compute_content_hash(file_bytes)
+                    document_id = revision_of or new_document_id()
+                    
+                    # Another session already processed these exact bytes
+                    registry = get_document_registry()
+                    handle = registry.acquire(content_hash)
+                    if handle is not None:
+                        registry.record_revision(document_id, content_hash)
+                        attach_document(handle, document_id)
+                        st.rerun()
+                    
+                    st.session_state.pending_document_id = document_id
+                    st.session_state.ingestion_job_id = get_ingestion_worker().submit(
+                        file_bytes,
+                        uploaded_file.name,
+                        content_hash=content_hash,
+                        document_id=document_id
+                    )
+                except IngestionQueueFull as e:
+                    st.error(str(e))
+                except Exception as e:
+                    st.error(f"Error processing document: {str(e)}")
+        
+        show_ingestion_notice()
+        if st.session_state.ingestion_job_id is not None:
+            show_ingestion_status()
     
     # Show chat messages if document is processed
     if st.session_state.document_processed:
         # Display messages
-        for message in st.session_state.messages:
+        for message in workspace.messages:
             if message["role"] == "user":
                 st.markdown(f"""
                 <div class="chat-message">
@@ -274,9 +377,13 @@ def main():
                 """, unsafe_allow_html=True)
         
         # Document info
-        if st.session_state.current_document:
-            doc = st.session_state.current_document
+        if workspace.document:
+            doc = workspace.document
             st.info(f"📄 Document: {doc['metadata']['title']} | Pages: {doc['metadata']['total_pages']} | Sections: {len(doc['sections'])}")
+            
+            if not st.session_state.show_upload and st.button("📄 Replace document"):
+                st.session_state.show_upload = True
+                st.rerun()
     
     st.markdown('</div>', unsafe_allow_html=True)
     
@@ -297,17 +404,17 @@ def main():
         send_button = st.button("Send")
     
     if send_button and user_input:
-        st.session_state.messages.append({"role": "user", "content": user_input})
+        workspace.messages.append({"role": "user", "content": user_input})
         
         if st.session_state.document_processed:
             with st.spinner("Thinking..."):
                 try:
-                    response = st.session_state.chat_agent.generate_response(user_input)
-                    st.session_state.messages.append({"role": "assistant", "content": response})
+                    response = workspace.chat_agent.generate_response(user_input)
+                    workspace.messages.append({"role": "assistant", "content": response})
                 except Exception as e:
                     st.error(f"Error: {str(e)}")
         else:
-            st.session_state.messages.append({
+            workspace.messages.append({
                 "role": "assistant", 
                 "content": "Please upload a PDF document first."
             })
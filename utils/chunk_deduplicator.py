@@ -0,0 +1,250 @@
+import difflib
+import hashlib
+import re
+import numpy as np
+from functools import lru_cache
+from typing import List, Dict, Optional, Set, Tuple
+from config import Config
+
+@lru_cache(maxsize=65536)
+def word_hash(word: str) -> int:
+    """Stable 64-bit word hash (fingerprints are spilled to disk, so no per-process salt)"""
+    return int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def mix64(values: np.ndarray) -> np.ndarray:
+    """SplitMix64 finalizer to spread combined word hashes over all 64 bits"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+def describe_differences(text: str, variant_text: str) -> str:
+    """Compact word-level description of how a near-duplicate variant differs from text"""
+    words = text.split()
+    variant_words = variant_text.split()
+    changes = []
+
+    matcher = difflib.SequenceMatcher(None, words, variant_words, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if i1 == i2 or j1 == j2:
+            # Pure insertion or deletion: anchor on the preceding word
+            i1, j1 = max(0, i1 - 1), max(0, j1 - 1)
+        changes.append(f'"{" ".join(variant_words[j1:j2])}" instead of "{" ".join(words[i1:i2])}"')
+    return "; ".join(changes)
+
+class ChunkDeduplicator:
+    """Collapse exact and near-duplicate chunks before they are embedded"""
+
+    BANDS = 8  # 64-bit fingerprints split into 8-bit bands for candidate lookup
+
+    def __init__(self):
+        self.config = Config()
+        self.bit_positions = np.arange(64, dtype=np.uint64)
+
+    def normalize(self, text: str) -> str:
+        """Lowercase and strip punctuation and spacing for SimHash; digits are kept"""
+        text = re.sub(r'[^a-z0-9\s]', ' ', text.lower())
+        return ' '.join(text.split())
+
+    def exact_key(self, text: str) -> str:
+        """Key for exact copies: only case and spacing may differ"""
+        return hashlib.sha1(' '.join(text.lower().split()).encode('utf-8')).hexdigest()
+
+    def similarity(self, text: str, other_text: str) -> float:
+        """Word-level similarity ratio used to confirm a SimHash match"""
+        return difflib.SequenceMatcher(None, text.split(), other_text.split(), autojunk=False).ratio()
+
+    def simhash(self, normalized_text: str) -> int:
+        """64-bit SimHash over word shingles"""
+        words = normalized_text.split()
+        if not words:
+            return 0
+
+        word_hashes = np.array([word_hash(word) for word in words], dtype=np.uint64)
+        size = min(self.config.DEDUP_SHINGLE_SIZE, len(words))
+        count = len(words) - size + 1
+
+        # Combine consecutive word hashes into one hash per shingle
+        hashes = np.zeros(count, dtype=np.uint64)
+        for offset in range(size):
+            hashes = mix64(hashes ^ word_hashes[offset:offset + count])
+        hashes = np.unique(hashes)
+
+        # Each bit votes +1/-1 per shingle; the sign of the total sets the fingerprint bit
+        bits = ((hashes[:, None] >> self.bit_positions) & np.uint64(1)).sum(axis=0)
+        fingerprint = 0
+        for position in np.nonzero(bits * 2 > len(hashes))[0]:
+            fingerprint |= 1 << int(position)
+        return fingerprint
+
+    def fingerprint(self, chunk: Dict) -> Tuple[str, int]:
+        """Exact-content key and SimHash for a chunk, cached on the chunk"""
+        if "content_key" not in chunk:
+            chunk["content_key"] = self.exact_key(chunk["text"])
+            chunk["simhash"] = self.simhash(self.normalize(chunk["text"]))
+        return chunk["content_key"], chunk["simhash"]
+
+    def bands(self, fingerprint: int) -> List[Tuple[int, int]]:
+        """Band keys; fingerprints differing in fewer than BANDS bits share at least one band"""
+        width = 64 // self.BANDS
+        mask = (1 << width) - 1
+        return [(band, (fingerprint >> (band * width)) & mask) for band in range(self.BANDS)]
+
+    def occurrence(self, chunk: Dict, variant: bool = False) -> Dict:
+        """Location record for one copy of a chunk; near-duplicate variants keep their own text"""
+        occurrence = {
+            "section": chunk["section"],
+            "chunk_id": chunk["chunk_id"],
+            "section_hash": chunk.get("section_hash")
+        }
+        # Page chunks all share the "General" section; the page tells their copies apart
+        if chunk.get("page_number") is not None:
+            occurrence["page_number"] = chunk["page_number"]
+        if variant:
+            occurrence["text"] = chunk["text"]
+        return occurrence
+
+    def find_near_duplicate(self, chunk: Dict, buckets: Dict) -> Optional[Dict]:
+        """Embedded chunk whose SimHash is close and whose words are near-identical, if any"""
+        fingerprint = chunk["simhash"]
+        for band in self.bands(fingerprint):
+            for candidate in buckets.get(band, []):
+                if (candidate["simhash"] ^ fingerprint).bit_count() > self.config.DEDUP_MAX_HAMMING:
+                    continue
+                if self.similarity(candidate["text"], chunk["text"]) >= self.config.DEDUP_MIN_SIMILARITY:
+                    return candidate
+        return None
+
+    def relocate_pages(self, occurrences: List[Dict], page_locations: Dict[str, List[int]]) -> List[Dict]:
+        """Move page occurrences to the pages their unchanged text is on now
+
+        Old and current pages with the same fingerprint are paired in order; copies on
+        pages that no longer carry that text are dropped.
+        """
+        old_pages = {}
+        for occurrence in occurrences:
+            if occurrence.get("page_number") is not None:
+                old_pages.setdefault(occurrence["section_hash"], set()).add(occurrence["page_number"])
+
+        moves = {}
+        for section_hash, pages in old_pages.items():
+            for old_page, new_page in zip(sorted(pages), page_locations.get(section_hash, [])):
+                moves[(section_hash, old_page)] = new_page
+
+        relocated = []
+        for occurrence in occurrences:
+            if occurrence.get("page_number") is None:
+                relocated.append(occurrence)
+            elif (occurrence["section_hash"], occurrence["page_number"]) in moves:
+                page_number = moves[(occurrence["section_hash"], occurrence["page_number"])]
+                relocated.append(dict(occurrence, page_number=page_number))
+        return relocated
+
+    def retain_occurrences(
+        self,
+        chunk: Dict,
+        retained_section_hashes: Set[str],
+        page_locations: Optional[Dict[str, List[int]]] = None
+    ) -> List[Dict]:
+        """Occurrences of an embedded chunk that survive a revision
+
+        If the chunk's own section or page changed, the first surviving variant becomes
+        the chunk text, and surviving exact copies of the old text become variants.
+        """
+        original = chunk.get("occurrences") or [self.occurrence(chunk)]
+        occurrences = [
+            occurrence for occurrence in original
+            if occurrence["section_hash"] in retained_section_hashes
+        ]
+        if page_locations is not None:
+            occurrences = self.relocate_pages(occurrences, page_locations)
+        occurrences = occurrences or original[:1]
+
+        head = occurrences[0]
+        if "page_number" in head:
+            chunk["page_number"] = head["page_number"]
+        if "text" not in head:
+            return occurrences
+
+        old_text = chunk["text"]
+        chunk.update(
+            text=head["text"],
+            section=head["section"],
+            chunk_id=head["chunk_id"],
+            section_hash=head["section_hash"],
+            word_count=len(head["text"].split())
+        )
+        chunk.pop("content_key", None)
+        chunk.pop("simhash", None)
+
+        rebased = []
+        for occurrence in occurrences:
+            text = occurrence.get("text", old_text)
+            occurrence = {key: value for key, value in occurrence.items() if key != "text"}
+            if text != chunk["text"]:
+                occurrence["text"] = text
+            rebased.append(occurrence)
+        return rebased
+
+    def collapse(
+        self,
+        chunks: List[Dict],
+        existing: Optional[List[Dict]] = None,
+        retained_section_hashes: Optional[Set[str]] = None,
+        page_locations: Optional[Dict[str, List[int]]] = None
+    ) -> Tuple[List[Dict], Dict]:
+        """Return the distinct chunks to embed and dedup statistics
+
+        Duplicates are folded into the first copy's "occurrences" list; near-duplicates
+        keep their own text there, so no distinct content is lost. Chunks in
+        `existing` are already embedded: new copies of them are recorded there and
+        are not returned. Their occurrences are first limited to
+        `retained_section_hashes`, which drops sections changed since the last revision,
+        and page occurrences are moved to their current `page_locations`.
+        """
+        exact = {}
+        buckets = {}
+        canonical = []
+        stats = {"total_chunks": len(chunks), "exact_duplicates": 0, "near_duplicates": 0}
+
+        def index_chunk(chunk: Dict) -> None:
+            content_key, fingerprint = self.fingerprint(chunk)
+            exact.setdefault(content_key, chunk)
+            for band in self.bands(fingerprint):
+                buckets.setdefault(band, []).append(chunk)
+
+        for chunk in existing or []:
+            if retained_section_hashes is not None:
+                chunk["occurrences"] = self.retain_occurrences(chunk, retained_section_hashes, page_locations)
+            else:
+                chunk["occurrences"] = chunk.get("occurrences") or [self.occurrence(chunk)]
+            index_chunk(chunk)
+
+        for chunk in chunks:
+            content_key, _ = self.fingerprint(chunk)
+            match = exact.get(content_key)
+            variant = False
+
+            if match is not None:
+                stats["exact_duplicates"] += 1
+            else:
+                match = self.find_near_duplicate(chunk, buckets)
+                if match is not None:
+                    stats["near_duplicates"] += 1
+                    variant = chunk["text"] != match["text"]
+
+            if match is not None:
+                # Copy rather than append: earlier revisions may share this list
+                match["occurrences"] = match["occurrences"] + [self.occurrence(chunk, variant=variant)]
+                continue
+
+            chunk["occurrences"] = [self.occurrence(chunk)]
+            index_chunk(chunk)
+            canonical.append(chunk)
+
+        stats["unique_chunks"] = len(canonical)
+        stats["embeddings_saved"] = stats["exact_duplicates"] + stats["near_duplicates"]
+        return canonical, stats
@@ -4,9 +4,11 @@ import numpy as np
 from PIL import Image
 import streamlit as st
 from typing import List, Dict, Optional, Tuple
+import hashlib
 import re
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from config import Config
+from utils.progress import IngestionCancelled, ProgressCallback, streamlit_progress_callback
 
 class AdvancedPDFProcessor:
     def __init__(self):
@@ -18,8 +20,11 @@ class AdvancedPDFProcessor:
             separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
         )
     
-    def extract_text_with_structure(self, pdf_file) -> Dict[str, any]:
+    def extract_text_with_structure(self, pdf_file, progress_callback: Optional[ProgressCallback] = None) -> Dict[str, any]:
         """Extract text with document structure preservation - Fixed regex patterns"""
+        # Background callers have no script context to show st.error, so they get the exception
+        raise_errors = progress_callback is not None
+        
         try:
             pdf_reader = PyPDF2.PdfReader(pdf_file)
             
@@ -33,12 +38,10 @@ class AdvancedPDFProcessor:
                 }
             }
             
-            progress_bar = st.progress(0)
-            status_text = st.empty()
+            if progress_callback is None:
+                progress_callback = streamlit_progress_callback()
             
             for page_num, page in enumerate(pdf_reader.pages):
-                status_text.text(f"Processing page {page_num + 1}/{len(pdf_reader.pages)}")
-                
                 page_text = page.extract_text()
                 
                 # Clean and structure the text
@@ -47,23 +50,35 @@ class AdvancedPDFProcessor:
                 document_data["pages"].append({
                     "page_number": page_num + 1,
                     "text": cleaned_text,
-                    "word_count": len(cleaned_text.split())
+                    "word_count": len(cleaned_text.split()),
+                    "content_hash": self.hash_text(cleaned_text)
                 })
                 
                 document_data["full_text"] += f"\n--- Page {page_num + 1} ---\n{cleaned_text}"
                 
-                progress_bar.progress((page_num + 1) / len(pdf_reader.pages))
+                progress_callback(
+                    (page_num + 1) / len(pdf_reader.pages),
+                    f"Processing page {page_num + 1}/{len(pdf_reader.pages)}"
+                )
             
             # Extract document sections with fixed regex
             document_data["sections"] = self.extract_sections(document_data["full_text"])
             
-            status_text.text("PDF processing complete!")
+            progress_callback(1.0, "PDF processing complete!")
             return document_data
             
+        except IngestionCancelled:
+            raise
         except Exception as e:
+            if raise_errors:
+                raise
             st.error(f"Error processing PDF: {str(e)}")
             return None
     
+    def hash_text(self, text: str) -> str:
+        """Fingerprint extracted text for revision comparison"""
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+    
     def clean_text(self, text: str) -> str:
         """Clean and normalize extracted text - Fixed regex patterns"""
         # Remove excessive whitespace
@@ -139,28 +154,117 @@ class AdvancedPDFProcessor:
         
         # Process sections first
         for section in document_data["sections"]:
-            section_chunks = self.text_splitter.split_text(section["content"])
-            
-            for i, chunk in enumerate(section_chunks):
-                chunks.append({
-                    "text": chunk,
-                    "section": section["title"],
-                    "chunk_id": f"{section['title']}_{i}",
-                    "word_count": len(chunk.split()),
-                    "type": "section"
-                })
+            chunks.extend(self.chunk_section(section))
         
-        # If no sections found, chunk the full text
+        # If no sections found, chunk the text page by page
         if not chunks:
-            text_chunks = self.text_splitter.split_text(document_data["full_text"])
-            
-            for i, chunk in enumerate(text_chunks):
-                chunks.append({
-                    "text": chunk,
-                    "section": "General",
-                    "chunk_id": f"general_{i}",
-                    "word_count": len(chunk.split()),
-                    "type": "general"
-                })
+            chunks = self.chunk_pages(document_data)
         
         return chunks
+    
+    def chunk_section(self, section: Dict) -> List[Dict]:
+        """Split one section into chunks tagged with the section fingerprint"""
+        section_hash = self.hash_text(f"{section['title']}\n{section['content']}")
+        chunks = []
+        
+        for i, chunk in enumerate(self.text_splitter.split_text(section["content"])):
+            chunks.append({
+                "text": chunk,
+                "section": section["title"],
+                "chunk_id": f"{section['title']}_{i}",
+                "word_count": len(chunk.split()),
+                "type": "section",
+                "section_hash": section_hash
+            })
+        
+        return chunks
+    
+    def chunk_pages(self, document_data: Dict) -> List[Dict]:
+        """Chunk each page separately when no sections were detected"""
+        chunks = []
+        for page in document_data["pages"]:
+            chunks.extend(self.chunk_page(page))
+        
+        return chunks
+    
+    def page_hash(self, page: Dict) -> str:
+        """Page fingerprint; content only, so an unchanged page that moved keeps its chunks"""
+        return page.get("content_hash") or self.hash_text(page["text"])
+    
+    def chunk_page(self, page: Dict) -> List[Dict]:
+        """Split one page into chunks tagged with the page fingerprint"""
+        page_hash = self.page_hash(page)
+        chunks = []
+        
+        for i, chunk in enumerate(self.text_splitter.split_text(page["text"])):
+            chunks.append({
+                "text": chunk,
+                "section": "General",
+                "chunk_id": f"general_{page_hash[:12]}_{i}",
+                "word_count": len(chunk.split()),
+                "type": "general",
+                "section_hash": page_hash,
+                "page_number": page["page_number"]
+            })
+        
+        return chunks
+    
+    def page_locations(self, document_data: Dict) -> Dict[str, List[int]]:
+        """Current page numbers of each page fingerprint, for relocating reused page chunks"""
+        locations = {}
+        for page in document_data["pages"]:
+            locations.setdefault(self.page_hash(page), []).append(page["page_number"])
+        
+        return locations
+    
+    def find_changed_pages(self, document_data: Dict, previous_document: Dict) -> List[int]:
+        """Page numbers whose extracted text differs from the previous revision"""
+        previous_hashes = {
+            page["page_number"]: page.get("content_hash")
+            for page in previous_document["pages"]
+        }
+        
+        return [
+            page["page_number"] for page in document_data["pages"]
+            if previous_hashes.get(page["page_number"]) != page["content_hash"]
+        ]
+    
+    def create_incremental_chunks(self, document_data: Dict, previous_chunks: List[Dict]) -> Tuple[List[Dict], List[int], set]:
+        """Chunk only sections (or pages, without sections) that changed since the previous revision
+        
+        Returns the new chunks, the positions of previous chunks that are still valid
+        and the fingerprints of the sections or pages carried over unchanged.
+        """
+        # A collapsed duplicate chunk belongs to every section it occurs in
+        previous_positions = {}
+        for position, chunk in enumerate(previous_chunks):
+            occurrences = chunk.get("occurrences") or [chunk]
+            for occurrence in occurrences:
+                previous_positions.setdefault(occurrence.get("section_hash"), set()).add(position)
+        
+        # Same units as create_intelligent_chunks: sections with content, otherwise pages
+        sections = [section for section in document_data["sections"] if section["content"]]
+        if sections:
+            units = [
+                (self.hash_text(f"{section['title']}\n{section['content']}"), section, self.chunk_section)
+                for section in sections
+            ]
+        else:
+            units = [(self.page_hash(page), page, self.chunk_page) for page in document_data["pages"]]
+        
+        new_chunks = []
+        retained_positions = set()
+        retained_hashes = set()
+        
+        for unit_hash, unit, chunk_unit in units:
+            if unit_hash in retained_hashes:
+                continue
+            
+            if unit_hash in previous_positions:
+                # Unchanged section or page: its chunks and embeddings carry over
+                retained_positions.update(previous_positions[unit_hash])
+                retained_hashes.add(unit_hash)
+            else:
+                new_chunks.extend(chunk_unit(unit))
+        
+        return new_chunks, sorted(retained_positions), retained_hashes
@@ -0,0 +1,25 @@
+import streamlit as st
+from typing import Callable
+
+ProgressCallback = Callable[[float, str], None]
+
+class IngestionCancelled(Exception):
+    """Raised from a progress callback to abort an ingestion job"""
+
+def streamlit_progress_callback() -> ProgressCallback:
+    """Create a progress callback that renders into Streamlit widgets"""
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    
+    def update(progress: float, message: str) -> None:
+        progress_bar.progress(min(1.0, progress))
+        status_text.text(message)
+    
+    return update
+
+def scaled_progress_callback(callback: ProgressCallback, start: float, end: float) -> ProgressCallback:
+    """Map a stage's 0-1 progress onto the [start, end] range of an overall callback"""
+    def update(progress: float, message: str) -> None:
+        callback(start + (end - start) * min(1.0, progress), message)
+    
+    return update
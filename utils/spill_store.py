@@ -0,0 +1,34 @@
+import json
+import os
+import shutil
+import tempfile
+import weakref
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+def create_spill_dir(owner, name: str, base_dir: Optional[str] = None) -> str:
+    """Create a private (0700) spill directory that is removed along with its owner"""
+    if base_dir:
+        os.makedirs(base_dir, mode=0o700, exist_ok=True)
+    # mkdtemp picks an unused name, so other users and processes cannot plant or read files in it
+    path = tempfile.mkdtemp(prefix=f"docugpt-{name}-", dir=base_dir)
+    weakref.finalize(owner, shutil.rmtree, path, True)
+    return path
+
+def write_spill(path: str, metadata: Dict, arrays: Optional[Dict[str, np.ndarray]] = None) -> None:
+    """Atomically write JSON metadata plus numpy arrays; nothing in the file is executable on load"""
+    payload = dict(arrays or {})
+    payload["metadata"] = np.frombuffer(json.dumps(metadata).encode("utf-8"), dtype=np.uint8)
+
+    temp_path = f"{path}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        np.savez(f, **payload)
+    os.replace(temp_path, path)
+
+def read_spill(path: str) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """Read a write_spill file back as (metadata, arrays)"""
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {key: data[key] for key in data.files}
+    metadata = json.loads(arrays.pop("metadata").tobytes().decode("utf-8"))
+    return metadata, arrays